@@ -27,18 +27,173 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import scipy.signal as signal
+import scipy.ndimage as ndimage
 import numpy as np
-import matplotlib.pyplot as plt
 import warnings
-from termcolor import colored
+from functools import lru_cache
 import signal_tools
-import traceback
 
 class AttrDict(dict):
     def __init__(self, *args, **kwargs):
         super(AttrDict, self).__init__(*args, **kwargs)
         self.__dict__ = self
 
+    def writable(self):
+        """
+        Returns a copy of result.data that can be modified, the filtered signal itself is read-only.
+        """
+        return np.array(self.data, copy=True)
+
+
+@lru_cache(maxsize=64)
+def _design_fir(numtaps, cutoff, pass_zero):
+    """
+    Designs (and caches) the taps of a windowed FIR filter, a filter with the same
+    parameters is only designed once per session.
+    The taps are returned in float32 and are shared between calls, so they must not be
+    modified in place, the filters only hand out copies of them.
+    """
+    return signal.firwin(numtaps=numtaps, cutoff=cutoff, pass_zero=pass_zero).astype(np.float32)
+
+
+@lru_cache(maxsize=64)
+def _design_iir(order, wn, btype):
+    """
+    Designs (and caches) a digital Butterworth filter, so the poles, bilinear transform
+    and section conversion are only computed once per set of parameters.
+    Returns a tuple (sos, b, a) with the second order sections in float32 and the
+    transfer function polynomials in float64.
+    The returned arrays are shared between calls and must not be modified in place, the filters
+    only hand out copies of them.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+        sos = signal.butter(order, wn, btype=btype, analog=False, output='sos').astype(np.float32)
+        b, a = signal.butter(order, wn, btype=btype, analog=False, output='ba')
+    #Older scipy versions raise a FutureWarning from within butter, only silence it here
+    return sos, b, a
+
+
+@lru_cache(maxsize=64)
+def _design_zi(order, wn, btype):
+    """
+    Computes (and caches) the steady-state initial conditions of a Butterworth filter
+    designed by _design_iir, scaled by the first sample before each filter pass.
+    The returned array is shared between calls and must not be modified in place.
+    """
+    sos = _design_iir(order, wn, btype)[0]
+    return signal.sosfilt_zi(sos).astype(sos.dtype)
+
+
+@lru_cache(maxsize=32)
+def _design_chain(stages):
+    """
+    Designs (and caches) a cascade of Butterworth filters, stages is a tuple of (order, wn, btype) tuples.
+    The second order sections of all stages are stacked into one filter, a cascade of biquads is still
+    a cascade of biquads, so the whole chain can be applied in a single zero-phase pass.
+    Returns a tuple (sos, zi) in float32, shared between calls like those of _design_iir.
+    """
+    sos = np.vstack([_design_iir(order, wn, btype)[0] for order, wn, btype in stages])
+    return sos, signal.sosfilt_zi(sos).astype(sos.dtype)
+
+
+def _padlen(sos):
+    """
+    Number of samples by which _filtfilt extends the signal on each side, equal to the
+    default padding of signal.sosfiltfilt.
+    """
+    ntaps = 2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def _odd_ext(data, padlen, out=None):
+    """
+    Odd extension of the signal by padlen samples at both ends of the last axis, the same padding
+    signal.sosfiltfilt uses to suppress the edge transients.
+    """
+    if(data.shape[-1] <= padlen):
+        raise ValueError("The signal must be longer than %d samples to be filtered" % padlen)
+    return np.concatenate((2 * data[..., :1] - data[..., padlen:0:-1],
+                           data,
+                           2 * data[..., -1:] - data[..., -2:-padlen-2:-1]), axis=-1, out=out)
+
+
+def _filtfilt_ext(sos, zi, ext, padlen):
+    """
+    Forward-backward filtering of a signal that was already extended by _odd_ext, the padding
+    is cut off again from the result.
+    """
+    zi = np.reshape(zi, (len(sos),) + (1,) * (ext.ndim - 1) + (2,))
+    filtered, _ = signal.sosfilt(sos, ext, axis=-1, zi=zi * ext[..., :1])
+    filtered, _ = signal.sosfilt(sos, filtered[..., ::-1], axis=-1, zi=zi * filtered[..., -1:])
+    #Forward pass, then a backward pass over the reversed output to cancel the phase shift
+
+    return filtered[..., ::-1][..., padlen:-padlen]
+
+
+def _filtfilt(sos, zi, data, ext=None):
+    """
+    Zero-phase forward-backward filtering along the last axis. The result equals
+    signal.sosfiltfilt with its default odd padding, but the initial conditions zi are
+    passed in precomputed instead of being solved again on every call.
+    A preallocated buffer for the padded signal can be passed as ext, its shape must be
+    data.shape[:-1] + (data.shape[-1] + 2 * _padlen(sos),).
+    """
+    data = np.ascontiguousarray(data, dtype=sos.dtype)
+    padlen = _padlen(sos)
+    return _filtfilt_ext(sos, zi, _odd_ext(data, padlen, out=ext), padlen)
+
+
+def _normalize_stages(stages, inv_nyquist):
+    """
+    Turns a list of (btype, cutoff, order) filter specifications into a hashable tuple of
+    (order, wn, btype) designs with cutoffs normalized to the nyquist frequency, inv_nyquist is 1 / nyquist.
+    Returns the designs together with a flat tuple of all cutoff frequencies in Hz.
+    """
+    design = []
+    cutoffs = []
+    for btype, cutoff, order in stages:
+        if(btype not in ("low", "high", "band")):
+            raise ValueError("Stage type must be either low, high or band")
+        cutoffs.extend(np.atleast_1d(cutoff).tolist())
+        design.append((order, tuple(np.atleast_1d(cutoff) * inv_nyquist) if btype == "band" else cutoff * inv_nyquist, btype))
+    return tuple(design), tuple(cutoffs)
+
+
+@lru_cache(maxsize=8)
+def _freq_axis(max_freq, worN=512):
+    """
+    Returns the (cached) grid of worN frequencies in Hz from 0 up to max_freq on which filter responses are evaluated.
+    """
+    return np.linspace(0, max_freq, worN)
+
+
+@lru_cache(maxsize=32)
+def _frequency_response(coefficients, shape, dtype, ftype, fs, max_freq):
+    """
+    Computes (and caches) the frequency response of a filter from 0 up to max_freq Hz.
+    The coefficients are passed as raw bytes together with their shape and dtype so they
+    can serve as a cache key, plotting the same filter again skips the evaluation.
+    Returns the frequencies in Hz and the complex response.
+    """
+    coefficients = np.frombuffer(coefficients, dtype=dtype).reshape(shape)
+    freqs = _freq_axis(max_freq)
+    if(ftype == "IIR"):
+        return signal.sosfreqz(coefficients, worN=freqs, fs=fs)
+    return signal.freqz(coefficients, worN=freqs, fs=fs)
+
+
+def _fir_filter(b, data):
+    """
+    Applies FIR taps along the last axis of the data through FFT based overlap-add convolution,
+    at O(N log N) cost instead of the O(N * numtaps) of signal.lfilter.
+    The output is centered on the input (mode='same'), which removes the group delay of
+    (numtaps - 1) / 2 samples of the linear-phase firwin designs.
+    """
+    data = np.asarray(data, dtype=np.float32)
+    b = np.reshape(b, (1,) * (data.ndim - 1) + (-1,))
+    return signal.oaconvolve(data, b, mode='same', axes=-1)
+
 
 class Filters:
     """
@@ -51,21 +206,46 @@ class Filters:
         Sampling rate to use with the functions.
     capture_length : `int`, `float`\n
         Duration of signal 
+    signalInterface : `SignalTools`\n
+        Optional SignalTools to share with this instance, a new one is created when it is None. Defaults to None
     
 
     Notes
     -----
     Functions you call on this class will inherit the sampling rate which you
-    have passed to the constructor when instantiating this class.
+    have passed to the constructor when instantiating this class.\n
+    All filters run in single precision (float32), which halves the memory traffic
+    of the filter passes and is well within the resolution of the sensor data.\n
+    FIR filters are compensated for their group delay, so just like the zero-phase IIR
+    filters their output lines up with the input signal.\n
+    The filtered signal in result.data is read-only, so it can be shared safely. Use result.writable() to get a copy that can be modified.
 
     """
-    warnings.simplefilter(action='ignore', category=FutureWarning)
     
 
-    def __init__(self, sampling_rate, capture_length):
+    def __init__(self, sampling_rate, capture_length, signalInterface=None):
         self.sampling_rate = sampling_rate
         self.nyquist_freq = sampling_rate / 2
-        self.signalInterface = signal_tools.SignalTools(sampling_rate, capture_length)
+        self._inv_nyquist = 1.0 / self.nyquist_freq
+        #Cutoffs are normalized with a multiply by the reciprocal instead of a division per call
+        if(signalInterface is None):
+            signalInterface = signal_tools.SignalTools(sampling_rate, capture_length)
+        self.signalInterface = signalInterface
+        self.signalInterface._filterInterface = self
+        #Let the SignalTools reuse this instance instead of building its own Filters
+        self._scratch = None
+
+
+    def _zero_phase(self, sos, zi, data):
+        """
+        Zero-phase IIR filtering through _filtfilt, the padded copy of the signal is written
+        into a buffer kept on this instance which is only reallocated when the shape changes.
+        """
+        data = np.ascontiguousarray(data, dtype=sos.dtype)
+        shape = data.shape[:-1] + (data.shape[-1] + 2 * _padlen(sos),)
+        if(self._scratch is None or self._scratch.shape != shape or self._scratch.dtype != sos.dtype):
+            self._scratch = np.empty(shape, dtype=sos.dtype)
+        return _filtfilt(sos, zi, data, ext=self._scratch)
 
 
     def lowpass(self, data, cutoff, order, ftype, plot=False):
@@ -78,7 +258,7 @@ class Filters:
         Parameters
         ----------
         data : `array_like`\n       
-            The array to be filtered
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
         cutoff : `int, float`\n     
             Desired cutoff frequency
         order   : `int`\n
@@ -100,25 +280,26 @@ class Filters:
             result.ftype         : Classification of the filter (IIR or FIR)
             
         """
-        normal_cutoff = cutoff / self.nyquist_freq
+        normal_cutoff = cutoff * self._inv_nyquist
 
         if(ftype == "IIR"):
-            sos = signal.butter(order, normal_cutoff, btype='low', analog=False, output='sos')
-            b, a = signal.butter(order, normal_cutoff, btype='low', analog=False, output='ba')
-            filtered_data = signal.sosfiltfilt(sos, data)
-            result = AttrDict(data=filtered_data, sos=sos, name="Lowpass filter", cutoff=cutoff, b=b, a=a, ftype="IIR")
+            sos, b, a = _design_iir(order, normal_cutoff, 'low')
+            filtered_data = self._zero_phase(sos, _design_zi(order, normal_cutoff, 'low'), data)
+            result = AttrDict(data=filtered_data, sos=sos.copy(), name="Lowpass filter", cutoff=cutoff, b=b.copy(), a=a.copy(), ftype="IIR")
 
         elif(ftype == "FIR"):
-            b = signal.firwin(numtaps=order+1, cutoff=normal_cutoff)
+            b = _design_fir(order+1, normal_cutoff, True)
             a = 1.0   #Denominator in an FIR system is 1
-            filtered_data = signal.lfilter(b, a, data)
-            result = AttrDict(data=filtered_data, name="Lowpass filter", cutoff=cutoff, b=b, a=a, ftype="FIR")
+            filtered_data = _fir_filter(b, data)
+            result = AttrDict(data=filtered_data, name="Lowpass filter", cutoff=cutoff, b=b.copy(), a=a, ftype="FIR")
 
         else:
-            print(colored("Filter type must be either IIR or FIR", 'red'))
-            return 
+            raise ValueError("Filter type must be either IIR or FIR") 
+
+        filtered_data.setflags(write=False)
 
         if(plot):
+            import matplotlib.pyplot as plt
             plt.figure("Lowpass filter")
             plt.grid()
             ax = plt.subplot(2, 1, 1)
@@ -131,7 +312,6 @@ class Filters:
             plt.plot(filtered_data, label="Na filter", color='g')
             plt.xlabel("Sample #")
             plt.ylabel("Amplitude")
-            plt.ylim=1
             plt.legend(loc="upper right")
             plt.text(1000, 0.04, "cutoff = %sHz\norder=%s"%(cutoff, order))
             self.show_filter_response(result)
@@ -141,6 +321,54 @@ class Filters:
         return result
 
 
+    def lowpass_stream(self, block, cutoff, order, state=None):
+        """
+        Streaming low-pass filter
+        Applies the Butterworth low-pass filter to one block of a longer recording, carrying the filter state
+        over to the next block. Feeding a recording through this block by block gives the same output as filtering
+        it in one go, with constant memory use.
+
+        Parameters
+        ----------
+        block : `array_like`\n
+            The next block of samples, a 2D array of shape (channels, samples) filters every channel in one call
+        cutoff : `int, float`\n
+            Desired cutoff frequency
+        order   : `int`\n
+            Order of the filter
+        state : `ndarray`\n
+            Filter state returned with the previous block, pass None (default) for the first block
+
+        Returns
+        ----------
+        result : `AttrDict`\n
+            result.data          : The output signal from the filter for this block\n
+            result.state         : The filter state to pass along with the next block\n
+            result.sos           : The filter coefficients in Second Order Section form\n
+            result.name          : Name of the filter\n
+            result.cutoff        : Cutoff frequency used in the filter \n
+            result.ftype         : Classification of the filter (IIR)
+
+        Notes
+        ----------
+        Unlike lowpass, this filter runs forward only and is therefore not zero-phase, the output lags the input
+        by the group delay of the filter. This is the price for not needing the samples of the next block.
+        """
+        normal_cutoff = cutoff * self._inv_nyquist
+        sos = _design_iir(order, normal_cutoff, 'low')[0]
+        block = np.asarray(block, dtype=np.float32)
+
+        if(state is None):
+            zi = _design_zi(order, normal_cutoff, 'low')
+            state = np.reshape(zi, (len(sos),) + (1,) * (block.ndim - 1) + (2,)) * block[..., :1]
+        #Start the first block in steady state with its first sample to avoid a start-up transient
+
+        filtered_data, state = signal.sosfilt(sos, block, axis=-1, zi=state)
+        filtered_data.setflags(write=False)
+        result = AttrDict(data=filtered_data, state=state, sos=sos.copy(), name="Lowpass filter", cutoff=cutoff, ftype="IIR")
+        return result
+
+
     def highpass(self, data, cutoff, order, ftype, plot=False):
         """
         A high-pass filter functions as the opposite of a low-pass filter. It passes frequencies above a given cutoff and filters 
@@ -149,7 +377,7 @@ class Filters:
         Parameters
         ----------
         data : `array_like`\n       
-            The array to be filtered
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
         cutoff : `int, float`\n     
             Desired cutoff frequency
         order   : `int`\n
@@ -171,24 +399,25 @@ class Filters:
             result.ftype         : Classification of the filter (IIR or FIR)
             
         """
-        normal_cutoff = cutoff / self.nyquist_freq
+        normal_cutoff = cutoff * self._inv_nyquist
         if(ftype == "IIR"):
-            sos = signal.butter(order, normal_cutoff, btype='high', analog=False, output='sos')
-            b, a = signal.butter(order, normal_cutoff, btype='high', analog=False, output='ba')
-            filtered_data = signal.sosfiltfilt(sos, data)
-            result = AttrDict(data=filtered_data, sos=sos, name="Highpass filter", cutoff=cutoff, b=b, a=a, ftype="IIR")
+            sos, b, a = _design_iir(order, normal_cutoff, 'high')
+            filtered_data = self._zero_phase(sos, _design_zi(order, normal_cutoff, 'high'), data)
+            result = AttrDict(data=filtered_data, sos=sos.copy(), name="Highpass filter", cutoff=cutoff, b=b.copy(), a=a.copy(), ftype="IIR")
 
         elif(ftype == "FIR"):
-            b = signal.firwin(numtaps=order+1, cutoff=normal_cutoff, pass_zero='highpass')
+            b = _design_fir(order+1, normal_cutoff, 'highpass')
             a = 1.0   #Denominator in an FIR system is 1
-            filtered_data = signal.lfilter(b, a, data)
-            result = AttrDict(data=filtered_data, name="Highpass filter", cutoff=cutoff, b=b, a=a, ftype="FIR")
+            filtered_data = _fir_filter(b, data)
+            result = AttrDict(data=filtered_data, name="Highpass filter", cutoff=cutoff, b=b.copy(), a=a, ftype="FIR")
 
         else:
-            print(colored("Filter type must be either IIR or FIR", 'red'))
-            return 
+            raise ValueError("Filter type must be either IIR or FIR") 
+
+        filtered_data.setflags(write=False)
 
         if(plot):
+            import matplotlib.pyplot as plt
             plt.figure("Highpass filter")
             plt.grid()
 
@@ -211,6 +440,45 @@ class Filters:
         return result
 
 
+    def chain(self, stages, data):
+        """
+        Filter chain
+        Applies several IIR filters after each other in one zero-phase pass instead of one pass per filter, so
+        no intermediate signal is written out for every stage.
+
+        Parameters
+        ----------
+        stages : `list`\n
+            List of (btype, cutoff, order) tuples, btype is "low", "high" or "band". The cutoff of a bandpass is a (low, high) tuple
+        data : `array_like`\n
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
+
+        Returns
+        ----------
+        result : `AttrDict`\n
+            result.data          : The output signal of the chain\n
+            result.sos           : The stacked filter coefficients of all stages in Second Order Section form\n
+            result.name          : Name of the filter\n
+            result.cutoff        : Cutoff frequencies of all stages \n
+            result.ftype         : Classification of the filter (IIR)
+
+        Notes
+        ----------
+        The padding and initial conditions at the signal edges are set up once for the whole chain instead of
+        per stage, so the output differs from calling the filters one by one. The difference is largest at the
+        edges and decays with the slowest stage, its size depends on the signal. With a low cutoff highpass it can
+        persist across the whole capture. Apply the filters one by one when the output has to match that.
+        """
+        design, cutoffs = _normalize_stages(stages, self._inv_nyquist)
+        sos, zi = _design_chain(design)
+        filtered_data = self._zero_phase(sos, zi, data)
+        result = AttrDict(data=filtered_data, sos=sos.copy(), name="Filter chain", cutoff=cutoffs, ftype="IIR")
+
+        filtered_data.setflags(write=False)
+
+        return result
+
+
     def median(self, data, kernel_size, plot=False):
         """
         A high-pass filter functions as the opposite of a low-pass filter. It passes frequencies above a given cutoff and filters 
@@ -219,7 +487,7 @@ class Filters:
         Parameters
         ----------
         data    : `array_like`\n       
-            The array to be filtered
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
         kernel_size : `int`\n     
             Must be odd! Kernel window which will be used to calculate averagee around the current value
         plot : `bool`\n
@@ -234,12 +502,14 @@ class Filters:
             
         """
         if(kernel_size%2==0):
-            print(colored("Median filter kernel size must be odd!\n", 'red'))
-            return
+            raise ValueError("Median filter kernel size must be odd")
 
-        filtered_data = signal.medfilt(data, kernel_size=kernel_size)
+        data = np.asarray(data, dtype=np.float32)
+        filtered_data = ndimage.median_filter(data, size=(1,) * (data.ndim - 1) + (kernel_size,), mode='constant', cval=0.0)
+        #Same zero-padded edges as signal.medfilt, but with ndimage's much faster selection algorithm
 
         if(plot):
+            import matplotlib.pyplot as plt
             plt.figure("Median filter")
             plt.grid()
 
@@ -258,6 +528,7 @@ class Filters:
             self.signalInterface.fft_plot(filtered_data)
 
         
+        filtered_data.setflags(write=False)
         result = AttrDict(data=filtered_data, name="Median Filter", kernel_size=kernel_size)
         return result
 
@@ -270,7 +541,7 @@ class Filters:
         Parameters
         ----------
         data : `array_like`\n       
-            The array to be filtered
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
         lowcut : `int, float`\n     
             Desired low cutoff frequency
         highcut : `int, float`\n     
@@ -295,29 +566,29 @@ class Filters:
             
         """
 
-        normal_low = lowcut / self.nyquist_freq
-        normal_high = highcut / self.nyquist_freq
+        normal_low = lowcut * self._inv_nyquist
+        normal_high = highcut * self._inv_nyquist
 
         if(ftype == "IIR"):
-            sos = signal.butter(order, [normal_low, normal_high], btype='band', analog=False, output='sos')
-            b, a = signal.butter(order, [normal_low, normal_high], btype='band', analog=False, output='ba')
-            filtered_data = signal.sosfiltfilt(sos, data)
-            result = AttrDict(data=filtered_data, sos=sos, name="Bandpass filter", cutoff=[lowcut, highcut], b=b, a=a, ftype="IIR")
+            sos, b, a = _design_iir(order, (normal_low, normal_high), 'band')
+            filtered_data = self._zero_phase(sos, _design_zi(order, (normal_low, normal_high), 'band'), data)
+            result = AttrDict(data=filtered_data, sos=sos.copy(), name="Bandpass filter", cutoff=[lowcut, highcut], b=b.copy(), a=a.copy(), ftype="IIR")
         elif(ftype == "IIRFF"):
-            sos = signal.butter(order, [normal_low, normal_high], btype='band', analog=False, output='sos')
-            b, a = signal.butter(order, [normal_low, normal_high], btype='band', analog=False, output='ba')
-            filtered_data = signal.sosfiltfilt(sos, data)
-            result = AttrDict(data=filtered_data, sos=sos, name="Bandpass filter", cutoff=[lowcut, highcut], b=b, a=a, ftype="IIR")
+            sos, b, a = _design_iir(order, (normal_low, normal_high), 'band')
+            filtered_data = self._zero_phase(sos, _design_zi(order, (normal_low, normal_high), 'band'), data)
+            result = AttrDict(data=filtered_data, sos=sos.copy(), name="Bandpass filter", cutoff=[lowcut, highcut], b=b.copy(), a=a.copy(), ftype="IIR")
         elif(ftype == "FIR"):
-            b = signal.firwin(numtaps=order+1, cutoff=[normal_low, normal_high], pass_zero=False)
+            b = _design_fir(order+1, (normal_low, normal_high), False)
             a = 1.0   #Denominator in an FIR system is 1
-            filtered_data = signal.lfilter(b, a, data)
-            result = AttrDict(data=filtered_data, name="Bandpass filter", cutoff=[lowcut, highcut], b=b, a=a, ftype="FIR") 
+            filtered_data = _fir_filter(b, data)
+            result = AttrDict(data=filtered_data, name="Bandpass filter", cutoff=[lowcut, highcut], b=b.copy(), a=a, ftype="FIR") 
         else:
-            print(colored("Filter type must be either IIR or FIR", 'red'))
-            return
+            raise ValueError("Filter type must be either IIR or FIR")
+
+        filtered_data.setflags(write=False)
 
         if(plot):
+            import matplotlib.pyplot as plt
             plt.figure("Bandpass filter")
             plt.grid()
 
@@ -352,32 +623,96 @@ class Filters:
         ----------
         none
         """
+        import matplotlib.pyplot as plt
+        #Imported here so filtering without plotting never loads matplotlib
+
         plt.figure("Frequency response")
+        max_freq = min(15, self.nyquist_freq)
+        #Only evaluate the response on the band that is plotted instead of all the way up to nyquist
 
-        if(filtered_dict.ftype=="IIR"):
-            w, h = signal.sosfreqz(filtered_dict.sos)
+        if(filtered_dict.get("ftype")=="IIR"):
+            coefficients = filtered_dict.sos
             plt.title("%s IIR" %(filtered_dict.name))
-        elif(filtered_dict.ftype=="FIR"):
-            w, h = signal.freqz(filtered_dict.b)
+        elif(filtered_dict.get("ftype")=="FIR"):
+            coefficients = filtered_dict.b
             plt.title("%s FIR" %(filtered_dict.name))
+        elif(filtered_dict.get("ftype")=="bank"):
+            raise ValueError("Cannot show one frequency response for a filter bank, pass the result of a single filter")
         else:
-            print(colored("Cannot show frequency respons of non-LTI filter!"), 'red')
+            raise ValueError("Cannot show frequency response of non-LTI filter")
+
+        w, h = _frequency_response(coefficients.tobytes(), coefficients.shape, coefficients.dtype.str,
+                                   filtered_dict.ftype, self.sampling_rate, max_freq)
 
-        plt.plot((self.nyquist_freq / np.pi) * w, abs(h), label="IIR")
+        plt.plot(w, abs(h), label="IIR")
         plt.plot([0, self.nyquist_freq], [np.sqrt(0.5), np.sqrt(0.5)],
                 '--', label='-3dB')
         
 
-        if "cutoff" in filtered_dict:
-            if(type(filtered_dict.cutoff) != int and type(filtered_dict.cutoff) != float):
-                for i in filtered_dict.cutoff:
-                    plt.axvline(x=i, color='green', linestyle='--', label='Cuttoff=%.2fHz' %(i))      #Support multiple cutoffs for bandpass
-            else:
-                plt.axvline(x=filtered_dict.cutoff, color='green', linestyle='--', label='Cuttoff frequentie')
+        for i in np.atleast_1d(filtered_dict.get("cutoff", ())):
+            plt.axvline(x=i, color='green', linestyle='--', label='Cuttoff=%.2fHz' %(i))      #Single cutoff or both edges of a bandpass
         plt.xlabel('Frequentie (Hz)')
         plt.ylabel('Gain')
         plt.grid(True)
         plt.legend(loc='best')
-        plt.xlim(left=0, right=15)
-        
+        plt.xlim(left=0, right=max_freq)
+
+
+
+class FilterBank:
+    """
+    A FilterBank applies a fixed set of zero-phase IIR filters to the same signal, for example a
+    row of bandpass filters to split a signal into frequency bands. The filters are designed once
+    when the bank is created and the padded copy of the signal is shared by all filters.
+
+    Parameters
+    ----------
+    sampling_rate : `int`, `float`\n
+        Sampling rate of the signals passed to the bank.
+    stages : `list`\n
+        List of (btype, cutoff, order) tuples, btype is "low", "high" or "band". The cutoff of a bandpass is a (low, high) tuple
+
+    Notes
+    -----
+    The signal is padded for the longest filter in the bank, so the first and last samples can differ
+    slightly from calling the filters one by one.
+    """
+
+
+    def __init__(self, sampling_rate, stages):
+        self.sampling_rate = sampling_rate
+        self.nyquist_freq = sampling_rate / 2
+        design, self.cutoffs = _normalize_stages(stages, 1.0 / self.nyquist_freq)
+        self.sos = tuple(_design_iir(*stage)[0].copy() for stage in design)
+        self.zi = tuple(_design_zi(*stage).copy() for stage in design)
+        self.padlen = max(_padlen(sos) for sos in self.sos)
+
+
+    def apply(self, data):
+        """
+        Filters the signal with every filter of the bank.
+
+        Parameters
+        ----------
+        data : `array_like`\n
+            The array to be filtered, a 2D array of shape (channels, samples) filters every channel in one call
+
+        Returns
+        ----------
+        result : `AttrDict`\n
+            result.data          : The output of each filter stacked along the first axis, of shape (filters,) + data.shape\n
+            result.sos           : The filter coefficients of each filter in Second Order Section form\n
+            result.name          : Name of the filter\n
+            result.cutoff        : Cutoff frequencies of all filters \n
+            result.ftype         : Classification of the result (bank), it holds the output of several filters
+        """
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        ext = _odd_ext(data, self.padlen)
+        #Pad the signal once for all filters instead of once per filter
+
+        filtered_data = np.empty((len(self.sos),) + data.shape, dtype=np.float32)
+        for i, (sos, zi) in enumerate(zip(self.sos, self.zi)):
+            filtered_data[i] = _filtfilt_ext(sos, zi, ext, self.padlen)
 
+        filtered_data.setflags(write=False)
+        return AttrDict(data=filtered_data, sos=self.sos, name="Filter bank", cutoff=self.cutoffs, ftype="bank")
@@ -27,19 +27,11 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import matplotlib.pyplot as plt
-import scipy.signal as signal
-import scipy.fft as fourier
-import scipy.linalg
 import numpy as np
 from termcolor import colored
 import sys
-from random import seed
-from random import randint
-import pandas as pd
 
 from filters import Filters
-from signal_tools import SignalTools
 
 
 
@@ -65,7 +57,7 @@ def importCSV(filename, capture_length, plot=False):
     Returns
     ----------
     result : `array_like`\n
-        Array of size `num_breaths * 375` which holds normalized respiratory data (i.e. y-axis from 0 to 1.)
+        Array of size `num_breaths * 375` which holds normalized respiratory data (i.e. y-axis from 0 to 1.) in single precision (float32)
 
     Notes
     ----------
@@ -77,27 +69,30 @@ def importCSV(filename, capture_length, plot=False):
     """
     Process CSV to read the raw values, modify "ECG" to column name which holds the data
     """
-    data = pd.read_csv(filename)
-
-    resp_data = data['ECG']
-    np_resp = np.array(resp_data)
+    with open(filename) as csv_file:
+        ecg_column = csv_file.readline().strip().split(',').index('ECG')
+    np_resp = np.genfromtxt(filename, delimiter=',', skip_header=1, usecols=ecg_column, dtype=np.float32)
+    #Only parse the one column we need, empty fields are read as NaN and left out of the normalization range
+    #Single precision is plenty for the sensor values and matches what the filters work in
 
 
     """
     Normalize the CSV data to 0-1 over the y-axis
     """
-    normalized_resp = np.zeros(len(np_resp))
-    min_resp = min(np_resp)
-    max_resp = max(np_resp)
-           
-
-    for idx, value in enumerate(np_resp):
-        normalized_resp[idx] = (np_resp[idx] - min_resp) / (max_resp - min_resp)
+    min_resp = np.nanmin(np_resp)
+    max_resp = np.nanmax(np_resp)
+    if(not plot):
+        np_resp = np_resp[0:((capture_length*sample_rate)*2)]
+    #The range is taken over the whole recording, but only the part that is returned needs to be scaled unless it is plotted
+    normalized_resp = (np_resp - min_resp) * (1.0 / (max_resp - min_resp))
+    #Vectorized over the whole array, scaling by the reciprocal multiplies every sample instead of dividing it
 
     """
     Plot the data and slice to amount of breaths. Note that these numbers are static with a sample rate of 125.
     """
     if(plot):
+        import matplotlib.pyplot as plt
+        #Imported here so reading a CSV without plotting never loads matplotlib
         plt.figure("CSV Data")
         plt.title("Ademhalingssignaal van patient")
         plt.xlabel("Sample")
@@ -111,7 +106,6 @@ def importCSV(filename, capture_length, plot=False):
 
 def main():
 
-    seed(1)
     capture_length = 30
     resp_data = importCSV(filename='./data/sit.csv', capture_length=capture_length, plot=True)
     num_samples = sample_rate * capture_length
@@ -124,16 +118,14 @@ def main():
     SignalTools gives us extra tools like sine wave generation, FFT's, downsampling etc.
     """
     filterInterface = Filters(sample_rate, capture_length)
-    signalInterface = SignalTools(sample_rate, capture_length)
+    signalInterface = filterInterface.signalInterface
+    #Filters already holds a SignalTools for the same sample rate and capture length, share it instead of building another
 
 
     """
     Generation of sine waves
     """
-    sine_respiratory = signalInterface.sine_generator(5)
-    sine_mains = signalInterface.sine_generator(50, 0.1)
-    sine_gen = signalInterface.sine_generator(40, 0.5)
-    sine_gen_2 = signalInterface.sine_generator(0.4, 4)
+    sine_respiratory, sine_mains, sine_gen, sine_gen_2 = signalInterface.sine_batch([5, 50, 40, 0.4], [1, 0.1, 0.5, 4])
 
     test_sine = sine_gen + sine_gen_2
 
@@ -163,6 +155,7 @@ def main():
     # print(found_frequency)
     
 
+    import matplotlib.pyplot as plt
     plt.show()
 
     print(colored('\nDone', 'green'))
@@ -26,22 +26,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import matplotlib.pyplot as plt
 import numpy as np
+import heapq
 import scipy.fft as fourier
 import scipy.signal as signal
-from itertools import islice
-from termcolor import colored
 import filters
-import time
 
 #Fourier Transforms
 
-class AttrDict(dict):
-    def __init__(self, *args, **kwargs):
-        super(AttrDict, self).__init__(*args, **kwargs)
-        self.__dict__ = self
-
 class SignalTools:
     
     """
@@ -55,23 +47,49 @@ class SignalTools:
         Sampling rate to use with the functions.\n
     capture_length : `int`
         Time or duration of signal.\n
+    dtype : `numpy.dtype`
+        Floating point precision of the generated signals, the fft and the samples passed to and returned from the
+        downsampling and counting methods. Defaults to float32. It does not apply to the filters, which always run
+        in float32, so the counts carry the single precision drift described below whatever dtype is.\n
 
     Notes
     -----
     Functions you call on this class will inherit the sampling rate and capture length which you
-    have passed to the constructor when instantiating this class.
+    have passed to the constructor when instantiating this class.\n
+    The sine generators, the fft and the downsampling and counting methods convert their input to `dtype`
+    once on entry. The default float32 is the same precision the filters work in.\n
+    Single precision can move a peak across a threshold, so the counts are not always identical to a
+    float64 run, they can shift by a few percent on some recordings.
 
     """
-    def __init__(self, sample_rate, capture_length):
+    def __init__(self, sample_rate, capture_length, dtype=np.float32):
 
         self.sample_rate = sample_rate
         self.capture_length = capture_length
         self.num_samples = capture_length * sample_rate
+        self.dtype = np.dtype(dtype)
+        self._ramp = np.arange(self.num_samples, dtype=self.dtype)
+        self._ramp.setflags(write=False)
+        #Sample index ramp shared by the sine generators, built once per instance
+        self._freq_axes = {}
+        #Frequency axes of the fft, one per transform length
+        self._filterInterface = None
 
 
-    def fft_plot(self, data):
+    def _filters(self):
         """
-        Plot the fast-fourier transform of a passed array, use this to analyze
+        Returns the Filters instance used by the downsampling and counting methods. It is created on first use
+        and reused afterwards, the Filters and this instance then share each other.
+        """
+        if(self._filterInterface is None):
+            self._filterInterface = filters.Filters(self.sample_rate, self.capture_length, signalInterface=self)
+        #Hand this instance to the Filters so it does not build a second SignalTools of its own
+        return self._filterInterface
+
+
+    def fft(self, data):
+        """
+        Computes the fast-fourier transform of a passed array without plotting it, use this to analyze
         the frequency-domain of your signals.
 
         Parameters
@@ -82,21 +100,31 @@ class SignalTools:
         Returns
         ---------- 
         result : `AttrDict`\n
-            result.x : Linear space of x-axis for the FFT to be plotted on \n
+            result.x : Linear space of x-axis for the FFT to be plotted on, shared between calls so read-only \n
             result.y : Modulus of each frequency bin in the FFT, use this as y-axis \n
             result.freq : Frequency resolution of the FFT \n
+            result.peak : The most prevalent frequency in the signal \n
 
         """
 
-        data_fft = fourier.fft(data)
-
-        N = data_fft.size
-
-        sample_spacing = self.capture_length / N
-        #Only interested in positive range of the FFT
-        frequency_resolution = self.sample_rate / N
-        xf = np.linspace(0, frequency_resolution*(N//2), int(N/2))
-        modulus = 2.0/N * np.abs(data_fft[:N//2])
+        data = np.asarray(data, dtype=self.dtype)
+        N = data.shape[-1]
+        n_fft = fourier.next_fast_len(N, real=True)
+        #Zero-pad to the nearest length that factors into small primes, awkward lengths make the FFT much slower
+
+        data_fft = fourier.rfft(data, n=n_fft, workers=-1)
+        #The signal is real, so only the positive half of the spectrum is computed
+        #Let pocketfft spread the transform over all cores, it caches its plans per length
+
+        frequency_resolution = self.sample_rate / n_fft
+        xf = self._freq_axes.get(n_fft)
+        if(xf is None):
+            xf = fourier.rfftfreq(n_fft, 1 / self.sample_rate)[:n_fft//2]
+            xf.setflags(write=False)
+            self._freq_axes[n_fft] = xf
+        modulus = np.abs(data_fft[:n_fft//2])
+        modulus *= 2.0/N
+        #Scale in place instead of allocating a second array for the result
         modulus[0] = 0.0 #DC gain = 0
 
         #Set the x linear axis space to the amount of frequency bins in the FFT
@@ -106,21 +134,138 @@ class SignalTools:
         max_idx = np.argmax(modulus)                
         peak = max_idx * frequency_resolution
         #Determine the most prevelant frequency
-        
+
+        result = filters.AttrDict(x=xf, y=modulus, freq=frequency_resolution, peak=peak)
+        return result
+
+
+    def fft_plot(self, data, show=False):
+        """
+        Plot the fast-fourier transform of a passed array, use this to analyze
+        the frequency-domain of your signals.
+
+        Parameters
+        ----------
+        data : `array-like`
+            Signal array to be analyzed.\n
+        show : `bool`
+            Defaults to False. Shows the figure and blocks until it is closed when True, otherwise the
+            figure is drawn and left to the caller to show.\n
+
+        Returns
+        ---------- 
+        result : `AttrDict`\n
+            The transform as returned by fft()
+        """
+        import matplotlib.pyplot as plt
+        #Imported here so analysis without plotting never loads matplotlib
+
+        result = self.fft(data)
+        step = max(1, len(result.x) // 10000)
+        #A screen cannot show more points than it has pixels, thin out very long spectra before drawing them
 
         plt.figure('Fast Fourier transform')
         plt.grid(True, which="both")
-        plt.semilogy(xf, modulus)
+        plt.semilogy(result.x[::step], result.y[::step])
         plt.xlim(0,self.sample_rate/2)
         plt.title("FFT")
         
         plt.xlabel('Frequentie (Hz)')
         plt.ylabel('Amplitude')
-        plt.scatter(x=peak, y=np.max(modulus), color='green', label='Piek bij: %0.5sHz' %peak)
+        plt.scatter(x=result.peak, y=np.max(result.y), color='green', label='Piek bij: %0.5sHz' %result.peak)
         plt.legend()
-        plt.show(block=True)
+        if(show):
+            plt.show(block=True)
+
+        return result
+
+
+    def stft(self, data, nperseg=1024, noverlap=512):
+        """
+        Computes a short-time fourier transform of a passed array, i.e. the spectrum of overlapping
+        windows of the signal instead of one spectrum over the whole capture.
+
+        Parameters
+        ----------
+        data : `array-like`
+            Signal array to be analyzed.\n
+        nperseg : `int`
+            Length of each window in samples. Defaults to 1024\n
+        noverlap : `int`
+            Amount of samples by which consecutive windows overlap. Defaults to 512\n
+
+        Returns
+        ---------- 
+        result : `AttrDict`\n
+            result.t : Time of the center of each window in seconds \n
+            result.x : Frequency of each bin \n
+            result.y : Modulus of each frequency bin per window, of shape (windows, bins) \n
+            result.freq : Frequency resolution of the STFT \n
+
+        """
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        if(not 0 <= noverlap < nperseg <= len(data)):
+            raise ValueError("Expected 0 <= noverlap < nperseg <= len(data), got noverlap=%d, nperseg=%d, len(data)=%d"
+                             % (noverlap, nperseg, len(data)))
+
+        step = nperseg - noverlap
+        num_frames = (len(data) - nperseg) // step + 1
+        frames = np.lib.stride_tricks.as_strided(data, shape=(num_frames, nperseg),
+                                                 strides=(step * data.strides[0], data.strides[0]), writeable=False)
+        #Overlapping windows as a strided view on the signal, nothing is copied until the window is applied
+
+        window = np.hanning(nperseg).astype(self.dtype)
+        data_fft = fourier.rfft(frames * window, axis=-1, workers=-1)
+        #All windows go through a single batched transform, the Hann window limits the spectral leakage
+
+        modulus = np.abs(data_fft)
+        modulus *= 2.0 / window.sum()
+        modulus[:, 0] = 0.0 #DC gain = 0
+
+        frequency_resolution = self.sample_rate / nperseg
+        xf = fourier.rfftfreq(nperseg, 1 / self.sample_rate)
+        t = (np.arange(num_frames) * step + nperseg / 2) / self.sample_rate
+
+        result = filters.AttrDict(t=t, x=xf, y=modulus, freq=frequency_resolution)
+        return result
+
+
+    def stft_plot(self, data, nperseg=1024, noverlap=512, show=False):
+        """
+        Plot the short-time fourier transform of a passed array as a spectrogram.
+
+        Parameters
+        ----------
+        data : `array-like`
+            Signal array to be analyzed.\n
+        nperseg : `int`
+            Length of each window in samples. Defaults to 1024\n
+        noverlap : `int`
+            Amount of samples by which consecutive windows overlap. Defaults to 512\n
+        show : `bool`
+            Defaults to False. Shows the figure and blocks until it is closed when True, otherwise the
+            figure is drawn and left to the caller to show.\n
+
+        Returns
+        ---------- 
+        result : `AttrDict`\n
+            The transform as returned by stft()
+        """
+        import matplotlib.pyplot as plt
+
+        result = self.stft(data, nperseg, noverlap)
+
+        plt.figure('Short-time Fourier transform')
+        plt.pcolormesh(result.t, result.x, result.y.T)
+        plt.ylim(0,self.sample_rate/2)
+        plt.title("STFT")
+        
+        plt.xlabel('Tijd (s)')
+        plt.ylabel('Frequentie (Hz)')
+        plt.colorbar(label='Amplitude')
+        if(show):
+            plt.show(block=True)
 
-        result = AttrDict(x=xf, y=modulus, freq=frequency_resolution)
         return result
 
 
@@ -139,7 +284,7 @@ class SignalTools:
         Returns
         ----------
         y_sine : `array_like`
-            Generated sine-wave\n
+            Generated sine-wave in the precision of `dtype`\n
 
         Notes
         ----------
@@ -147,13 +292,72 @@ class SignalTools:
         Both these variables are pre-defined in the instantiation of this class to prevent
         missmatching arrays.
         """
-        samples = np.linspace(0.0, self.capture_length, self.num_samples, endpoint=False)
-        y_sine = np.sin(2 * np.pi * sinefreq * samples)
-        return y_sine * amplitude_modifier
+        omega = self.dtype.type(2 * np.pi * sinefreq / self.sample_rate)
+        period = self.sample_rate / sinefreq if sinefreq > 0 else 0.0
+        if(float(period).is_integer() and 0 < period < self.num_samples):
+            y_sine = np.resize(np.sin(self._ramp[:int(period)] * omega), self.num_samples)
+        #With a whole number of samples per period the wave repeats exactly, so only one period has to be evaluated
+        else:
+            y_sine = self._ramp * omega
+            np.sin(y_sine, out=y_sine)
+        y_sine *= amplitude_modifier
+        #Build the phase from the cached sample index ramp with the angular step hoisted out, then work in-place
+        return y_sine
+
+
+
+    def sine_batch(self, sinefreqs, amplitude_modifiers=1):
+        """
+        Returns several sine-waves at once, one row per passed frequency. Row i matches
+        sine_generator(sinefreqs[i], amplitude_modifiers[i]) up to rounding,
+        but all rows are computed in one go.
+
+        Parameters
+        ----------
+        sinefreqs : `float`, `array_like`
+            Frequencies of the generated sine-waves, a single value gives one row \n
+        amplitude_modifiers : `float`, `array_like`
+            Amplitude of each sine-wave, a single value applies to all of them. Defaults to 1 \n
+
+        Returns
+        ----------
+        y_sine : `array_like`
+            Generated sine-waves in the precision of `dtype`, of shape (len(sinefreqs), num_samples)\n
+        """
+        scale = (2 * np.pi * np.atleast_1d(np.asarray(sinefreqs, dtype=np.float64)) / self.sample_rate).astype(self.dtype)
+        y_sine = self._ramp * scale[:, None]
+        np.sin(y_sine, out=y_sine)
+        y_sine *= np.atleast_1d(np.asarray(amplitude_modifiers, dtype=self.dtype)).reshape(-1, 1)
+        #One outer product and a single in-place sin over the whole block instead of one call per sine
+        return y_sine
+
+
+
+    def sine_sum(self, sinefreqs, amplitude_modifiers=1):
+        """
+        Returns the sum of several sine-waves, i.e. one signal containing all of the passed frequencies.
+
+        Parameters
+        ----------
+        sinefreqs : `float`, `array_like`
+            Frequencies of the summed sine-waves, a single value gives just that sine-wave \n
+        amplitude_modifiers : `float`, `array_like`
+            Amplitude of each sine-wave, a single value applies to all of them. Defaults to 1 \n
+
+        Returns
+        ----------
+        y_sine : `array_like`
+            Summed sine-wave in the precision of `dtype`, of length num_samples\n
+        """
+        y_sines = self.sine_batch(sinefreqs)
+        amplitudes = np.broadcast_to(np.atleast_1d(np.asarray(amplitude_modifiers, dtype=self.dtype)), (len(y_sines),))
+        y_sine = amplitudes @ y_sines
+        #Scaling and summing the rows is a single matrix-vector product
+        return y_sine
 
 
 
-    def downsample(self, data, chunk_size, anti_alias=True):
+    def downsample(self, data, chunk_size, anti_alias=True, verbose=False):
         """
         Returns an array downsampled by a variable factor. The average over a chunk, which size is defined by chunk_size\n
         is calculated and placed into the downsampled array.
@@ -168,6 +372,8 @@ class SignalTools:
         anti_alias: `bool`
             Defaults to True. Applies a low-pass filter to the signal before downsampling to prevent aliasing.
             Skips this step when False. 
+        verbose: `bool`
+            Defaults to False. Prints the size of the original and the resulting buffer when True.
 
         Returns
         ----------
@@ -179,36 +385,37 @@ class SignalTools:
         Minimal and maximum values are trimmed off the original data based on the chunk size.\n
         The input array is sorted and the array is trimmed so that the first and last quarter are trimmed off.
         """
+        data = np.ascontiguousarray(data, dtype=self.dtype)
         downsampled_rate = self.sample_rate / chunk_size
         nyquist = downsampled_rate/2
-        filterInterface = filters.Filters(self.sample_rate, self.capture_length)
+        filterInterface = self._filters()
         slice_int = chunk_size//3
-        min_maxed = np.zeros(slice_int)
 
         if(anti_alias):
             antialias = filterInterface.lowpass(data, nyquist-0.01, order=8, ftype="IIR", plot=False)
-            it = iter(antialias.data)
+            samples = antialias.data
         else:
-            it = iter(data)
+            samples = data
         #Apply an anti-aliasing filter by default
 
-        sliced_data = list(iter(lambda: tuple(islice(it, chunk_size)), ()))
-        downsampled = np.zeros(len(sliced_data))
-
-
-        for idx, value in enumerate(sliced_data):
-            to_sort = list(value)
-            to_sort.sort()
-            min_maxed = to_sort[slice_int:chunk_size-slice_int]
-            downsampled[idx] = np.average(min_maxed)
-        #Determine the average of the chunk in the original array and use this as the new value in the downsampled array
-
-        print('Size of original data buffer: \n', len(data))
-        print('Size of downsampled data buffer: \n', len(downsampled))
+        num_chunks = -(-len(samples) // chunk_size)
+        full_length = len(samples) - len(samples) % chunk_size
+        downsampled = np.zeros(num_chunks, dtype=self.dtype)
+
+        chunks = np.partition(samples[:full_length].reshape(-1, chunk_size), (slice_int, chunk_size-slice_int-1), axis=1)
+        downsampled[:full_length // chunk_size] = chunks[:, slice_int:chunk_size-slice_int].mean(axis=1)
+        if(full_length < len(samples)):
+            downsampled[-1] = np.sort(samples[full_length:])[slice_int:chunk_size-slice_int].mean()
+        #Partition every chunk at once as a row of a 2D view, only the values that are trimmed off have to be
+        #separated from the middle band, which is then averaged. A full sort is not needed for that
+        #A shorter last chunk is trimmed and averaged on its own, just like the full ones
+        if(verbose):
+            print('Size of original data buffer: \n', len(data))
+            print('Size of downsampled data buffer: \n', len(downsampled))
 
         return downsampled
 
-    def decimate(self, data, factor, anti_alias=True):
+    def decimate(self, data, factor, anti_alias=True, verbose=False):
         """
         Returns an array which is decimated by a factor. Decimation simply means that out of every M samples, 1 is kept and the rest is discarded,
         M is the factor.
@@ -222,6 +429,8 @@ class SignalTools:
         anti_alias: `bool`
             Defaults to True. Applies a low-pass filter to the signal before decimation to prevent aliasing.
             Skips this step when False. 
+        verbose: `bool`
+            Defaults to False. Prints the size of the original and the resulting buffer when True.
 
         Returns
         ----------
@@ -229,33 +438,27 @@ class SignalTools:
             The decimated array.
 
         """
-        downsampled_rate = self.sample_rate / factor
-        nyquist = downsampled_rate/2
-        filterInterface = filters.Filters(self.sample_rate, self.capture_length)
+        data = np.ascontiguousarray(data, dtype=self.dtype)
 
         if(anti_alias):
-            antialias = filterInterface.lowpass(data, nyquist-0.01, order=8, ftype="IIR", plot=False)
-            it = iter(antialias.data)
+            downsampled = signal.resample_poly(data, 1, factor)
         else:
-            it = iter(data)
-        sliced_data = list(iter(lambda: tuple(islice(it, factor)), ()))
-        downsampled = np.zeros(len(sliced_data))
-        #Apply an anti-aliasing filter by default
+            downsampled = data[::factor].copy()
+        #Apply an anti-aliasing filter by default. The polyphase decimator only evaluates its low-pass FIR at the
+        #samples that are kept, instead of filtering the whole signal and then discarding most of it.
+        #Without it, the first sample of every block of factor samples is kept. The strided slice is copied so the
+        #result never shares memory with the caller's signal
 
-        for idx, value in enumerate(sliced_data):
-            to_decimate = list(value)
-            downsampled[idx] = to_decimate[0]
-
-
-        print('Size of original data buffer: \n', len(data))
-        print('Size of decimated data buffer: \n', len(downsampled))
+        if(verbose):
+            print('Size of original data buffer: \n', len(data))
+            print('Size of decimated data buffer: \n', len(downsampled))
 
         return downsampled
         
 
 
 
-    def original_count(self, data):
+    def original_count(self, data, plot=True):
         """
         Original counting method
         This function implements the original counting method to count respiratory cycles as described in:
@@ -267,14 +470,16 @@ class SignalTools:
         ----------
         data : `array_like`\n       
             The signal from which the frequency is to be extracted.
+        plot : `bool`\n
+            Plot the filter, the signal and the found extrema, defaults to True. Pass False to only compute the frequency.
         Returns
         ----------
         result : `float`\n
             The found frequency in the signal.
         """
-        true_maxima = true_minima = resp_cycles = np.zeros(0)
-        filterInterface = filters.Filters(self.sample_rate, self.capture_length)
-        result = filterInterface.bandpass(data, lowcut=0.5, highcut=5, order=10, ftype="IIR", plot=True)
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        filterInterface = self._filters()
+        result = filterInterface.bandpass(data, lowcut=0.5, highcut=5, order=10, ftype="IIR", plot=plot)
         #Apply the filter suggested by the paper.
 
 
@@ -282,58 +487,49 @@ class SignalTools:
         minima = signal.find_peaks(-result.data)
         #Find the extrema of the signal
 
-        ordinates = np.zeros(len(maxima[0]))
-        for idx, i in enumerate(maxima[0]):
-            ordinates[idx] = result.data[i]
+        ordinates = result.data[maxima[0]]
         #Find the ordinate values of all maxima
 
         quartile = np.quantile(ordinates, .75)
         Q = 0.2 * quartile
         #Define a threshold Q as 0.2 * third quartile of the ordinates
 
-        plt.figure("Frequentie extractie")
-        plt.title("Originele count-methode")
-        plt.plot(result.data, label='Gefiltered signaal')
-        plt.axhline(y=Q, color='green', linestyle='--', label='Threshold')
-
-        for i in maxima:
-            for j in i:
-                if result.data[j] > Q:
-                    true_maxima = np.append(true_maxima, j)
-                    plt.plot(j, result.data[j], "ro")
+        true_maxima = maxima[0][ordinates > Q]
         #True maxima are defined to be a maxima above Q
 
-        for k in minima:
-            for l in k:
-                if result.data[l] < 0:
-                    true_minima = np.append(true_minima, l)
-                    plt.plot(l, result.data[l], "ro", color="green")
+        true_minima = minima[0][result.data[minima[0]] < 0]
         #True minima are defined to be a minima below 0
 
-        total_distance = 0
-        for idx, i in enumerate(true_maxima):
-            if(idx < len(true_maxima)-1):
-                count = ((true_maxima[idx] < true_minima) & (true_minima < true_maxima[idx+1])).sum()
-                #Find whether a respiratory cycle is present.
-                #this is defined to start and end at a true maxima, only and only if there is a single true minima between these two.
-                if(count == 1):
-                    resp_cycles = np.append(resp_cycles, true_maxima[idx])
-                    total_distance = total_distance + (true_maxima[idx+1] - true_maxima[idx])
-                #Add the distance of the respiratory cycle to the running total.
-            else:
-                break
+        after_maximum = np.searchsorted(true_minima, true_maxima, side='right')
+        before_maximum = np.searchsorted(true_minima, true_maxima, side='left')
+        cycle = (before_maximum[1:] - after_maximum[:-1]) == 1
+        #Find whether a respiratory cycle is present between every pair of successive true maxima.
+        #this is defined to start and end at a true maxima, only and only if there is a single true minima between these two.
+        #Both index arrays are sorted, so the number of minima in between follows from two binary searches
+
+        resp_cycles = true_maxima[:-1][cycle]
+        total_distance = int(np.diff(true_maxima)[cycle].sum())
+        #Add the distances of the respiratory cycles to the total.
         
+        if(plot):
+            import matplotlib.pyplot as plt
+            plt.figure("Frequentie extractie")
+            plt.title("Originele count-methode")
+            plt.plot(result.data, label='Gefiltered signaal')
+            plt.axhline(y=Q, color='green', linestyle='--', label='Threshold')
+            plt.plot(true_maxima, result.data[true_maxima], "ro")
+            plt.plot(true_minima, result.data[true_minima], "go")
+            plt.grid()
+            plt.legend()
+            plt.show()
 
-        plt.grid()
-        plt.legend()
-        plt.show()
         mean = total_distance / len(resp_cycles)
         frequency = 1 / (mean / self.sample_rate)
         #Determine the respiratory rate from the total distance and amount of respiratory cycles.
 
         return frequency
 
-    def advanced_count(self, data):
+    def advanced_count(self, data, plot=True):
         """
         Advanced counting method
         This function implements the original counting method to count respiratory cycles as described in:
@@ -345,32 +541,26 @@ class SignalTools:
         ----------
         data : `array_like`\n       
             The signal from which the frequency is to be extracted.
+        plot : `bool`\n
+            Plot the signal, the threshold and the found extrema, defaults to True. Pass False to only compute the frequency.
         Returns
         ----------
         result : `float`\n
             The found frequency in the signal.
         """
 
-        plt.figure()
-        filterInterface = filters.Filters(self.sample_rate, self.capture_length)
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        filterInterface = self._filters()
         result = filterInterface.bandpass(data, lowcut=0.1, highcut=0.5, order=5, ftype="IIR", plot=False)
         #Apply the filter as suggested by the paper
 
         
-        extrema = []
-        y_dif = []
-
         maxima = signal.find_peaks(result.data)
         minima = signal.find_peaks(-result.data)
         #Find the extrema in the signal    
 
-        maxima_list = list(maxima[0])
-        minima_list = list(minima[0])
-        #Cast the tuples as returned by the find_peaks() function to lists for further processing
-        
-        extrema = maxima_list + minima_list
-        extrema.sort()
-        #Sort all the extrema. This will give a list with all the extrema in sequence.
+        extrema = np.sort(np.concatenate((maxima[0], minima[0])))
+        #Sort all the extrema. This will give an array with all the extrema in sequence.
 
         def calculate_diff(extrema):
             """
@@ -379,78 +569,92 @@ class SignalTools:
             Parameters
             ----------
             extrema : `array_like`\n       
-                The list of extrema
+                The array of extrema
             Returns
             ----------
             result : `array_like`\n
                 The ordinate differences between the sequential extrema.
             """
-            y_dif.clear()
-            for idx, i in enumerate(extrema):
-                if(idx < len(extrema)-1):
-                    y_dif.append((i, np.abs(result.data[i] - result.data[extrema[idx+1]])))
-
-            return y_dif
+            return np.abs(np.diff(result.data[extrema]))
 
 
 
-        def threshold_check(data, threshold):
+        def threshold_check(extrema, threshold):
             """
-            Recursive function to minimize the extrema list to only contain pairs with an ordinate difference above the threshold
+            Minimizes the extrema to only contain pairs with an ordinate difference above the threshold.
+            The pair with the smallest ordinate difference is removed until all differences are above the threshold.
 
             Parameters
             ----------
-            data : `array_like`\n       
-                The list of extrema
+            extrema : `array_like`\n       
+                The array of extrema
             threshold : `float`\n       
                 The threshold for a minimum ordinate difference between two extrema.
             Returns
             ----------
             result : `array_like`\n
-                The list of extrema, all sequential extrema have an ordinate difference higher than the threshold.
+                The array of extrema, all sequential extrema have an ordinate difference higher than the threshold.
+                Like the original recursive implementation, the last remaining extremum is not included.
             """
+            ordinates = result.data[extrema]
+            remaining = len(extrema)
+            previous = list(range(-1, remaining - 1))
+            following = list(range(1, remaining + 1))
+            alive = np.ones(remaining, dtype=bool)
+            #The surviving extrema form a linked list, so removing a pair only touches its two neighbours
+
+            heap = [(y, i, i + 1) for i, y in enumerate(calculate_diff(extrema).tolist())]
+            heapq.heapify(heap)
+            #Keep the ordinate differences of all neighbouring pairs in a heap, on a tie the first pair comes out first
+
+            while True:
+                distance, left, right = heap[0]
+                if(not alive[left] or following[left] != right):
+                    heapq.heappop(heap)
+                    continue
+                #Skip pairs of which one of the extrema has been removed in the meantime
+
+                if(distance >= threshold):
+                    break
+                heapq.heappop(heap)
+                alive[left] = alive[right] = False
+                remaining -= 2
+                #If the smallest ordinate difference is smaller than the threshold, remove the pair
+                if(remaining < 2):
+                    raise ValueError("Not enough extrema above the threshold to count respiratory cycles")
+
+                before, after = previous[left], following[right]
+                if(before >= 0):
+                    following[before] = after
+                if(after < len(extrema)):
+                    previous[after] = before
+                if(before >= 0 and after < len(extrema)):
+                    heapq.heappush(heap, (float(np.abs(ordinates[after] - ordinates[before])), before, after))
+                #As a pair is deleted, the extrema around it become neighbours and only their difference needs to be calculated
             
-            y = [i[1] for i in data]
-            min_distance = min(y)
-            min_index = y.index(min_distance)
-            #Find the smallest ordinate difference between two sequential extrema
-
-            if min_distance < threshold:
-                if min_index == (len(data)-1):
-                    extrema.remove(data[min_index][0])
-                    extrema.pop()
-                    
-                else:
-                    extrema.remove(data[min_index][0])
-                    extrema.remove(data[min_index+1][0])
-            #If the smallest ordinate difference is smaller than the threshold, remove the pair
-            
-                new_y = calculate_diff(extrema)
-                #As a pair is deleted, new pairs are introduced and new vertical differences need to be calculated
-                threshold_check(new_y, threshold)
-                #Check the threshold again with the new vertical differences until all is above the threshold
-            
-            return [i[0] for i in data]
+            extrema = extrema[alive]
+            return extrema[:-1]
 
                 
+        if(len(extrema) < 2):
+            raise ValueError("Not enough extrema in the signal to count respiratory cycles")
         initial_vdiff = calculate_diff(extrema)
 
-        y = [i[1] for i in initial_vdiff]
-        quartile = np.quantile(y, .75)
+        quartile = np.quantile(initial_vdiff, .75)
         Q = 0.3 * quartile
         #Define the threshold Q as 0.3 * the third quartile of the vertical differences
 
 
-        plt.axhline(y=Q, color='green', linestyle='--', label='Threshold')    
-
-        true_extrema = threshold_check(initial_vdiff, Q)
+        true_extrema = threshold_check(extrema, Q)
         #Minimize the extrema until each pair of extrema satisfies the vertical difference threshold
 
-        plt.plot(result.data)
-        for i in true_extrema:
-            plt.plot(i, result.data[i], "ro")
+        if(plot):
+            import matplotlib.pyplot as plt
+            plt.figure()
+            plt.axhline(y=Q, color='green', linestyle='--', label='Threshold')
+            plt.plot(result.data)
+            plt.plot(true_extrema, result.data[true_extrema], "ro")
         
-        resp_cycles = []
         total_distance = 0
         for idx, i in enumerate(true_extrema):
             if idx < len(true_extrema) - 1: